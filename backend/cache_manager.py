@@ -1,46 +1,117 @@
+import asyncio
 import json
 import hashlib
 import os
+import threading
+import time
+from functools import partial
 from pathlib import Path
-from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
+from cachetools import TLRUCache
+
+try:
+    import xxhash
+    USING_XXHASH = True
+except ImportError:
+    USING_XXHASH = False
+
+try:
+    import orjson
+    USING_ORJSON = True
+except ImportError:
+    USING_ORJSON = False
+
+def _dumps(obj: Any) -> bytes:
+    if USING_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def _loads(raw: bytes) -> Any:
+    if USING_ORJSON:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+# Bump when the key format changes so old cache files are never matched
+CACHE_KEY_VERSION = "v3"
 
 class CacheManager:
     """Simple file-based cache manager for API responses"""
     
-    def __init__(self, cache_dir: str = "cache", ttl_hours: int = 24):
+    def __init__(self, cache_dir: str = "cache", ttl_hours: int = 24, memory_size: int = 256):
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True)
-        self.ttl = timedelta(hours=ttl_hours)
+        self.ttl_seconds = ttl_hours * 3600
+        # In-process tier in front of the files; values are (expires_at, data)
+        self._mem = TLRUCache(maxsize=memory_size, ttu=lambda _key, value, _now: value[0], timer=time.time)
+        self._mem_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if USING_XXHASH:
+            self._hasher_ctor = xxhash.xxh3_64
+        else:
+            self._hasher_ctor = partial(hashlib.blake2b, digest_size=8)
     
     def _generate_key(self, **kwargs) -> str:
         """Generate cache key from parameters"""
-        # Sort keys for consistent hashing
-        sorted_params = sorted(kwargs.items())
-        param_string = json.dumps(sorted_params, sort_keys=True)
-        return hashlib.sha256(param_string.encode()).hexdigest()
+        # Feed sorted key/value pairs straight into the hasher (no JSON round-trip)
+        h = self._hasher_ctor()
+        for k in sorted(kwargs):
+            h.update(k.encode())
+            h.update(b'\x00')
+            h.update(repr(kwargs[k]).encode())
+            h.update(b'\x01')
+        return f"{CACHE_KEY_VERSION}_{h.hexdigest()}"
+    
+    def _count(self, counter: str) -> None:
+        """Bump a hit/miss counter; get() runs in worker threads via aget()"""
+        with self._mem_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
     
     def get(self, **kwargs) -> Optional[Dict[Any, Any]]:
         """Get cached data if exists and not expired"""
         cache_key = self._generate_key(**kwargs)
         cache_file = self.cache_dir / f"{cache_key}.json"
         
-        if not cache_file.exists():
+        with self._mem_lock:
+            entry = self._mem.get(cache_key)
+        if entry is not None:
+            self._count('memory_hits')
+            return entry[1]
+        
+        try:
+            # Reject expired files from their mtime without reading them
+            expires_at = cache_file.stat().st_mtime + self.ttl_seconds
+            if time.time() > expires_at:
+                cache_file.unlink()
+                self._count('misses')
+                return None
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+        except OSError as e:
+            print(f"Cache read error: {e}")
+            self._count('misses')
             return None
         
         try:
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                cached_data = json.load(f)
+            with open(cache_file, 'rb') as f:
+                cached_data = _loads(f.read())
             
-            # Check if cache is expired
-            cached_time = datetime.fromisoformat(cached_data['timestamp'])
-            if datetime.now() - cached_time > self.ttl:
+            # Check if cache is expired (old ISO-string timestamps count as expired)
+            cached_time = cached_data.get('timestamp')
+            if not isinstance(cached_time, (int, float)) or time.time() - cached_time > self.ttl_seconds:
                 cache_file.unlink()  # Delete expired cache
+                self._count('misses')
                 return None
             
+            with self._mem_lock:
+                self._mem[cache_key] = (expires_at, cached_data['data'])
+            self._count('disk_hits')
             return cached_data['data']
         except Exception as e:
             print(f"Cache read error: {e}")
+            self._count('misses')
             return None
     
     def set(self, data: Dict[Any, Any], **kwargs) -> None:
@@ -50,26 +121,49 @@ class CacheManager:
         
         try:
             cache_data = {
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': time.time(),
                 'params': kwargs,
                 'data': data
             }
             
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, ensure_ascii=False, indent=2)
+            with open(cache_file, 'wb') as f:
+                f.write(_dumps(cache_data))
+            
+            with self._mem_lock:
+                self._mem[cache_key] = (time.time() + self.ttl_seconds, data)
         except Exception as e:
             print(f"Cache write error: {e}")
     
+    async def aget(self, **kwargs) -> Optional[Dict[Any, Any]]:
+        """Non-blocking get for use inside async endpoints"""
+        return await asyncio.to_thread(self.get, **kwargs)
+    
+    async def aset(self, data: Dict[Any, Any], **kwargs) -> None:
+        """Non-blocking set for use inside async endpoints"""
+        await asyncio.to_thread(self.set, data, **kwargs)
+    
+    def stats(self) -> Dict[str, int]:
+        """In-process tier size and hit/miss counters"""
+        with self._mem_lock:
+            return {
+                "memory_cached_items": len(self._mem),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses
+            }
+    
     def clear_expired(self) -> int:
         """Clear all expired cache files"""
+        with self._mem_lock:
+            self._mem.expire()
+        
+        # Only our own files: osmnx also caches Overpass responses as *.json here.
+        # Each of ours is written once by set(), so mtime is the write time
+        threshold = time.time() - self.ttl_seconds
         cleared = 0
-        for cache_file in self.cache_dir.glob("*.json"):
+        for cache_file in self.cache_dir.glob(f"{CACHE_KEY_VERSION}_*.json"):
             try:
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    cached_data = json.load(f)
-                
-                cached_time = datetime.fromisoformat(cached_data['timestamp'])
-                if datetime.now() - cached_time > self.ttl:
+                if cache_file.stat().st_mtime < threshold:
                     cache_file.unlink()
                     cleared += 1
             except Exception:
@@ -79,6 +173,9 @@ class CacheManager:
     
     def clear_all(self) -> int:
         """Clear all cache files"""
+        with self._mem_lock:
+            self._mem.clear()
+        
         cleared = 0
         for cache_file in self.cache_dir.glob("*.json"):
             try:
@@ -1,5 +1,8 @@
 import os
-import requests
+import asyncio
+import heapq
+import time
+import httpx
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi import Limiter, _rate_limit_exceeded_handler
@@ -9,8 +12,11 @@ import osmnx as ox
 import geopandas as gpd
 import pandas as pd
 from pydantic import BaseModel, validator
-from typing import List, Dict
+from typing import List, Dict, Tuple
+from functools import lru_cache
+from string import Template
 from dotenv import load_dotenv
+from cachetools import TTLCache
 from cache_manager import CacheManager
 
 try:
@@ -43,6 +49,23 @@ else:
     model = genai.GenerativeModel('gemini-2.5-flash')
     print("⚠️ Using deprecated google.generativeai package")
 
+# Shared async HTTP client so Nominatim lookups reuse keep-alive connections
+NOMINATIM_HEADERS = {
+    "User-Agent": "MarketGapHunter_StudentProject_V2/1.0 (thanyatle2004@gmail.com)",
+    "Referer": "http://127.0.0.1:8000"
+}
+
+@app.on_event("startup")
+async def open_http_client():
+    app.state.http = httpx.AsyncClient(headers=NOMINATIM_HEADERS, timeout=5)
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await app.state.http.aclose()
+
+# Autocomplete results keyed by (query.lower(), country); users retype prefixes a lot
+AUTOCOMPLETE_CACHE = TTLCache(maxsize=1024, ttl=600)
+
 # Rate Limiting
 limiter = Limiter(key_func=get_remote_address)
 app.state.limiter = limiter
@@ -68,6 +91,56 @@ BUSINESS_MAPPINGS = {
     "Gym/Fitness": {"tags": {"leisure": "fitness_centre"}},
     "Coworking Space": {"tags": {"amenity": "coworking_space"}},
 }
+BUSINESS_TYPES = frozenset(BUSINESS_MAPPINGS)
+BUSINESS_TYPE_ERROR = f'Business type must be one of: {list(BUSINESS_MAPPINGS)}'
+
+# Demand segmentation: tag value -> customer group
+DEMAND_TAGS_MAP = {
+    'office': 'Office',
+    'school': 'Students',
+    'university': 'Students',
+    'college': 'Students',
+    'apartments': 'Residential',
+    'condominium': 'Residential',
+    'residential': 'Residential',
+    'station': 'Transport'
+}
+
+DEMAND_QUERY_TAGS = {
+    'office': True,
+    'amenity': ['school', 'university', 'college'],
+    'building': ['apartments', 'condominium', 'residential'],
+    'public_transport': ['station']
+}
+
+# คะแนนตามประเภทสถานที่ (class, type) -> score; "*" = ทุก type ใน class นั้น
+PLACE_PRIORITY = {
+    # POI และสถานที่เฉพาะเจาะจง (คะแนนสูงสุด)
+    ("amenity", "*"): 100,
+    ("shop", "*"): 95,
+    ("tourism", "*"): 90,
+    ("leisure", "*"): 85,
+    ("building", "*"): 80,
+    
+    # ถนน/ซอย (ค่อนข้างเฉพาะเจาะจง)
+    ("highway", "*"): 70,
+    
+    # ย่าน/เขต (กลางๆ)
+    ("place", "neighbourhood"): 60,
+    ("place", "suburb"): 55,
+    ("place", "quarter"): 58,
+    ("place", "city_block"): 62,
+    ("place", "hamlet"): 50,
+    ("place", "village"): 45,
+    ("place", "town"): 40,
+    ("place", "city"): 35,
+    ("place", "state"): 10,
+    ("place", "country"): 5,
+    ("place", "*"): 30,
+    
+    # เขตการปกครอง (คะแนนต่ำ)
+    ("boundary", "*"): 20,
+}
 
 # --- 4. PYDANTIC MODELS WITH VALIDATION ---
 class AnalyzeRequest(BaseModel):
@@ -96,8 +169,8 @@ class AnalyzeRequest(BaseModel):
     
     @validator('business_type')
     def validate_business_type(cls, v):
-        if v not in BUSINESS_MAPPINGS:
-            raise ValueError(f'Business type must be one of: {list(BUSINESS_MAPPINGS.keys())}')
+        if v not in BUSINESS_TYPES:
+            raise ValueError(BUSINESS_TYPE_ERROR)
         return v
 
 class AIRequest(BaseModel):
@@ -109,19 +182,89 @@ class AIRequest(BaseModel):
     growth_status: str
 
 # --- 4. HELPER FUNCTIONS ---
-def create_ai_prompt(data: AIRequest) -> str:
-    """สร้าง prompt สำหรับ AI"""
-    # รายชื่อธุรกิจที่ระบบรองรับ
-    available_businesses = "Cafe, Restaurant, Bar/Pub, Convenience Store, Pharmacy, Gym/Fitness, Coworking Space"
+def _place_priority(place_class: str, place_type: str) -> int:
+    """คะแนนของสถานที่จาก class/type (ค่าเริ่มต้น 40)"""
+    score = PLACE_PRIORITY.get((place_class, place_type))
+    if score is None:
+        score = PLACE_PRIORITY.get((place_class, "*"), 40)
+    return score
+
+# ผล Overpass ถูก memoize ต่อ (grid cell, radius, query); `day` ทำให้ข้อมูลรีเฟรชทุกวัน
+# osmnx โยน InsufficientResponseError เมื่อไม่พบข้อมูล: คืนผลว่างเพื่อให้ถูก cache ด้วย
+# ส่วน error จาก network/HTTP จะถูกโยนต่อและไม่ถูก cache
+# เก็บเฉพาะผลที่แปลงแล้ว (list/dict) แทน GeoDataFrame เพื่อไม่ให้กินหน่วยความจำ
+@lru_cache(maxsize=256)
+def _fetch_supply(lat_q: int, lon_q: int, radius: int, business_type: str, day: int) -> List[dict]:
+    """ดึงร้านคู่แข่ง (Supply) รอบจุด แล้วแปลงเป็นรายการพิกัด"""
+    supply_tags = BUSINESS_MAPPINGS[business_type]["tags"]
+    try:
+        supply_gdf = ox.features_from_point((lat_q / 1e4, lon_q / 1e4), tags=supply_tags, dist=radius)
+    except ox._errors.InsufficientResponseError:
+        return []
+    
+    # กรองแถวที่ไม่มี geometry ก่อน แล้วค่อยคำนวณ centroid
+    supply_gdf = supply_gdf.loc[supply_gdf.geometry.notna()]
+    centroids = supply_gdf.geometry.centroid
+    if 'name' in supply_gdf.columns:
+        names = supply_gdf['name'].fillna("Unknown")
+    else:
+        names = pd.Series("Unknown", index=supply_gdf.index)
+    return [
+        {"lat": y, "lon": x, "name": name}
+        for x, y, name in zip(centroids.x.values, centroids.y.values, names.values)
+        if pd.notna(y) and pd.notna(x)
+    ]
+
+@lru_cache(maxsize=256)
+def _fetch_demand(lat_q: int, lon_q: int, radius: int, day: int) -> Tuple[Dict[str, int], List[dict]]:
+    """ดึงสถานที่ดึงดูดลูกค้า (Demand) แล้วคืน (สัดส่วนกลุ่มลูกค้า, รายการพิกัด)"""
+    demand_breakdown = {"Office": 0, "Students": 0, "Residential": 0, "Transport": 0}
+    try:
+        demand_gdf = ox.features_from_point((lat_q / 1e4, lon_q / 1e4), tags=DEMAND_QUERY_TAGS, dist=radius)
+    except ox._errors.InsufficientResponseError:
+        return demand_breakdown, []
     
-    return f"""คุณคือผู้เชี่ยวชาญด้านการวางแผนกลยุทธ์ธุรกิจและการเลือกทำเลที่ตั้ง (Business Consultant)
-กรุณาวิเคราะห์ศักยภาพของทำเลนี้สำหรับการเปิด "{data.business_type}" โดยอ้างอิงจากข้อมูลสถิติดังนี้:
+    # จัดกลุ่ม (Segmentation) แบบ vectorized เฉพาะคอลัมน์ tag ที่ query มา
+    category = pd.Series(index=demand_gdf.index, dtype=object)
+    for col in DEMAND_QUERY_TAGS:
+        if col not in demand_gdf.columns:
+            continue
+        mask = demand_gdf[col].isin(DEMAND_TAGS_MAP.keys()) & category.isna()
+        category.loc[mask] = demand_gdf.loc[mask, col].map(DEMAND_TAGS_MAP)
+    # ถ้าหาไม่เจอ ให้โยนลง Residential (ค่า Default)
+    category = category.fillna("Residential")
+    for group, count in category.value_counts().items():
+        demand_breakdown[group] += int(count)
+    
+    # เตรียมพิกัด
+    demand_gdf = demand_gdf.loc[demand_gdf.geometry.notna()]
+    if len(demand_gdf) > 1000: demand_gdf = demand_gdf.sample(1000)
+    centroids = demand_gdf.geometry.centroid
+    demand_points = [
+        {"lat": y, "lon": x}
+        for x, y in zip(centroids.x.values, centroids.y.values)
+        if pd.notna(y) and pd.notna(x)
+    ]
+    return demand_breakdown, demand_points
+
+@lru_cache(maxsize=256)
+def _fetch_construction(lat_q: int, lon_q: int, radius: int, day: int) -> int:
+    """นับพื้นที่ก่อสร้างรอบจุด (ใช้ดูแนวโน้มการเติบโต)"""
+    try:
+        cons_gdf = ox.features_from_point((lat_q / 1e4, lon_q / 1e4), tags={'landuse': 'construction'}, dist=radius)
+    except ox._errors.InsufficientResponseError:
+        return 0
+    return len(cons_gdf)
+
+# Prompt template is built once at import; only per-request fields are substituted
+_PROMPT_TEMPLATE = Template("""คุณคือผู้เชี่ยวชาญด้านการวางแผนกลยุทธ์ธุรกิจและการเลือกทำเลที่ตั้ง (Business Consultant)
+กรุณาวิเคราะห์ศักยภาพของทำเลนี้สำหรับการเปิด "${business_type}" โดยอ้างอิงจากข้อมูลสถิติดังนี้:
 
-- Opportunity Score: {data.score} (คะแนนยิ่งสูงแปลว่ามีความต้องการตลาดมาก คู่แข่งน้อย)
-- จำนวนร้านคู่แข่งในรัศมี 1 กม.: {data.supply_count} ร้าน
-- จำนวนสถานที่ดึงดูดลูกค้า (Demand): {data.demand_count} แห่ง
-- สัดส่วนกลุ่มลูกค้าเป้าหมาย: {data.demand_breakdown}
-- แนวโน้มการเติบโตของพื้นที่ (ก่อสร้างใหม่): {data.growth_status}
+- Opportunity Score: ${score} (คะแนนยิ่งสูงแปลว่ามีความต้องการตลาดมาก คู่แข่งน้อย)
+- จำนวนร้านคู่แข่งในรัศมี 1 กม.: ${supply_count} ร้าน
+- จำนวนสถานที่ดึงดูดลูกค้า (Demand): ${demand_count} แห่ง
+- สัดส่วนกลุ่มลูกค้าเป้าหมาย: ${demand_breakdown}
+- แนวโน้มการเติบโตของพื้นที่ (ก่อสร้างใหม่): ${growth_status}
 
 รูปแบบการตอบกลับ (ขอสั้นๆ กระชับ อ่านง่าย เป็นภาษาไทย สไตล์มืออาชีพ):
 
@@ -134,11 +277,22 @@ def create_ai_prompt(data: AIRequest) -> str:
 💡 **กลยุทธ์แนะนำ:** 
 ให้แนะนำ 1 กลยุทธ์การตลาดที่เหมาะสม 
 
-แต่ถ้าหากวิเคราะห์สถิติแล้วพบว่าทำเลนี้ "ไม่เหมาะสม" หรือมีความเสี่ยงสูงเกินไปสำหรับ "{data.business_type}" 
-ให้แนะนำผู้ใช้งานเปลี่ยนไปทำธุรกิจอื่นแทน โดยต้องเลือกแนะนำจากรายชื่อธุรกิจเหล่านี้เท่านั้น: [{available_businesses}]
+แต่ถ้าหากวิเคราะห์สถิติแล้วพบว่าทำเลนี้ "ไม่เหมาะสม" หรือมีความเสี่ยงสูงเกินไปสำหรับ "${business_type}" 
+ให้แนะนำผู้ใช้งานเปลี่ยนไปทำธุรกิจอื่นแทน โดยต้องเลือกแนะนำจากรายชื่อธุรกิจเหล่านี้เท่านั้น: [Cafe, Restaurant, Bar/Pub, Convenience Store, Pharmacy, Gym/Fitness, Coworking Space]
 พร้อมบอกเหตุผลสั้นๆ ว่าทำไมธุรกิจใหม่ถึงเหมาะกว่า
 
-สำคัญ: ใส่บรรทัดว่างระหว่างแต่ละหัวข้อ และใช้ ** สำหรับหัวข้อ"""
+สำคัญ: ใส่บรรทัดว่างระหว่างแต่ละหัวข้อ และใช้ ** สำหรับหัวข้อ""")
+
+def create_ai_prompt(data: AIRequest) -> str:
+    """สร้าง prompt สำหรับ AI"""
+    return _PROMPT_TEMPLATE.substitute(
+        business_type=data.business_type,
+        score=data.score,
+        supply_count=data.supply_count,
+        demand_count=data.demand_count,
+        demand_breakdown=data.demand_breakdown,
+        growth_status=data.growth_status,
+    )
 
 # --- 5. API ENDPOINTS ---
 
@@ -158,7 +312,8 @@ def cache_stats():
     return {
         "total_cached_items": len(cache_files),
         "cache_dir": str(cache.cache_dir),
-        "ttl_hours": cache.ttl.total_seconds() / 3600
+        "ttl_hours": cache.ttl_seconds / 3600,
+        **cache.stats()
     }
 
 @app.post("/cache/clear")
@@ -184,9 +339,13 @@ def search_place(request: Request, query: str):
 
 @app.get("/autocomplete")
 @limiter.limit("30/minute")
-def autocomplete(request: Request, query: str, country: str = ""):
+async def autocomplete(request: Request, query: str, country: str = ""):
     print(f"🔎 Autocomplete: {query} in {country}")
     
+    cache_key = (query.lower(), country)
+    if cache_key in AUTOCOMPLETE_CACHE:
+        return AUTOCOMPLETE_CACHE[cache_key]
+    
     url = "https://nominatim.openstreetmap.org/search"
     
     params = {
@@ -200,13 +359,8 @@ def autocomplete(request: Request, query: str, country: str = ""):
     if country:
         params["countrycodes"] = country
 
-    headers = {
-        "User-Agent": "MarketGapHunter_StudentProject_V2/1.0 (thanyatle2004@gmail.com)",
-        "Referer": "http://127.0.0.1:8000"
-    }
-    
     try:
-        response = requests.get(url, params=params, headers=headers)
+        response = await app.state.http.get(url, params=params)
         
         if response.status_code != 200:
             print(f"❌ Nominatim Error! Status: {response.status_code}")
@@ -216,9 +370,9 @@ def autocomplete(request: Request, query: str, country: str = ""):
         
         # ระบบให้คะแนนความเกี่ยวข้อง (Relevance Scoring)
         scored_results = []
+        query_lower = query.lower()
         
         for item in data:
-            score = 0
             place_type = item.get("type", "")
             place_class = item.get("class", "")
             importance = float(item.get("importance", 0))
@@ -235,54 +389,17 @@ def autocomplete(request: Request, query: str, country: str = ""):
                 continue
             
             # ให้คะแนนตามประเภทสถานที่ (ยิ่งเฉพาะเจาะจงยิ่งดี)
-            priority_map = {
-                # POI และสถานที่เฉพาะเจาะจง (คะแนนสูงสุด)
-                "amenity": 100,
-                "shop": 95,
-                "tourism": 90,
-                "leisure": 85,
-                "building": 80,
-                
-                # ถนน/ซอย (ค่อนข้างเฉพาะเจาะจง)
-                "highway": 70,
-                
-                # ย่าน/เขต (กลางๆ)
-                "place": {
-                    "neighbourhood": 60,
-                    "suburb": 55,
-                    "quarter": 58,
-                    "city_block": 62,
-                    "hamlet": 50,
-                    "village": 45,
-                    "town": 40,
-                    "city": 35,
-                    "state": 10,
-                    "country": 5
-                },
-                
-                # เขตการปกครอง (คะแนนต่ำ)
-                "boundary": 20,
-            }
-            
-            # คำนวณคะแนน
-            if place_class in priority_map:
-                if isinstance(priority_map[place_class], dict):
-                    score = priority_map[place_class].get(place_type, 30)
-                else:
-                    score = priority_map[place_class]
-            else:
-                score = 40  # คะแนนเริ่มต้น
+            score = _place_priority(place_class, place_type)
             
             # โบนัสจาก importance (ค่าที่ Nominatim คำนวณให้)
             score += importance * 20
             
             # โบนัสถ้าชื่อตรงกับคำค้นหา (case-insensitive)
             display_name_lower = item["display_name"].lower()
-            query_lower = query.lower()
             
             if display_name_lower.startswith(query_lower):
                 score += 30  # ขึ้นต้นด้วยคำค้นหา
-            elif query_lower in display_name_lower.split(",")[0].lower():
+            elif query_lower in display_name_lower.split(",", 1)[0]:
                 score += 20  # อยู่ในส่วนแรกของชื่อ
             elif query_lower in display_name_lower:
                 score += 10  # อยู่ที่ไหนสักแห่งในชื่อ
@@ -296,8 +413,8 @@ def autocomplete(request: Request, query: str, country: str = ""):
                 "class": place_class
             })
         
-        # เรียงตามคะแนนจากมากไปน้อย
-        scored_results.sort(key=lambda x: x["score"], reverse=True)
+        # เลือก 8 อันดับคะแนนสูงสุด (ไม่ต้อง sort ทั้งหมด)
+        top_results = heapq.nlargest(8, scored_results, key=lambda x: x["score"])
         
         # ส่งกลับแค่ 8 อันดับแรก (ไม่ต้องส่ง score ไปให้ frontend)
         suggestions = [
@@ -306,9 +423,10 @@ def autocomplete(request: Request, query: str, country: str = ""):
                 "lat": r["lat"],
                 "lon": r["lon"]
             }
-            for r in scored_results[:8]
+            for r in top_results
         ]
         
+        AUTOCOMPLETE_CACHE[cache_key] = suggestions
         return suggestions
         
     except Exception as e:
@@ -321,97 +439,56 @@ async def analyze_market(request: Request, req: AnalyzeRequest):
     print(f"🌍 Received Request: {req.business_type} at ({req.lat}, {req.lon})")
     
     # Check cache first
+    # Quantize to an integer 1e-4 degree grid (~11 m) so nearby taps share a key
     cache_key_params = {
-        "lat": round(req.lat, 4),  # Round to reduce cache misses
-        "lon": round(req.lon, 4),
+        "lat_q": int(round(req.lat * 1e4)),
+        "lon_q": int(round(req.lon * 1e4)),
         "business_type": req.business_type,
         "radius": req.radius
     }
     
-    cached_result = cache.get(**cache_key_params)
+    cached_result = await cache.aget(**cache_key_params)
     if cached_result:
         print("✅ Returning cached result")
         return cached_result
     
-    if req.business_type not in BUSINESS_MAPPINGS:
+    if req.business_type not in BUSINESS_TYPES:
         raise HTTPException(status_code=400, detail="Business type not supported")
     
-    center_point = (req.lat, req.lon)
-    supply_tags = BUSINESS_MAPPINGS[req.business_type]["tags"]
+    lat_q, lon_q = cache_key_params["lat_q"], cache_key_params["lon_q"]
+    day = int(time.time() // 86400)
     
-    # A. Fetch Supply
-    supply_points = []
-    num_supply = 0
-    try:
-        supply_gdf = ox.features_from_point(center_point, tags=supply_tags, dist=req.radius)
-        if not supply_gdf.empty:
-            supply_gdf['centroid'] = supply_gdf.geometry.centroid
-            for p, row in zip(supply_gdf['centroid'], supply_gdf.to_dict('records')):
-                name = row.get('name', 'Unknown')
-                if pd.isna(name): name = "Unknown"
-                if pd.notna(p.y) and pd.notna(p.x):
-                    supply_points.append({"lat": p.y, "lon": p.x, "name": name})
-            num_supply = len(supply_points)
-    except Exception as e:
-        print(f"Error supply: {e}")
-
-    # B. Fetch Demand & Breakdown
-    demand_tags_map = {
-        'office': 'Office',
-        'school': 'Students',
-        'university': 'Students',
-        'college': 'Students',
-        'apartments': 'Residential',
-        'condominium': 'Residential',
-        'residential': 'Residential',
-        'station': 'Transport'
-    }
+    # Fetch supply, demand and construction from Overpass in parallel
+    supply_result, demand_result, cons_result = await asyncio.gather(
+        asyncio.to_thread(_fetch_supply, lat_q, lon_q, req.radius, req.business_type, day),
+        asyncio.to_thread(_fetch_demand, lat_q, lon_q, req.radius, day),
+        asyncio.to_thread(_fetch_construction, lat_q, lon_q, req.radius, day),
+        return_exceptions=True
+    )
     
-    query_tags = {
-        'office': True,
-        'amenity': ['school', 'university', 'college'],
-        'building': ['apartments', 'condominium', 'residential'],
-        'public_transport': ['station']
-    }
+    # A. Supply
+    supply_points = []
+    if isinstance(supply_result, Exception):
+        print(f"Error supply: {supply_result}")
+    else:
+        supply_points = supply_result
+    num_supply = len(supply_points)
 
+    # B. Demand & Breakdown
     demand_points = []
     demand_breakdown = {"Office": 0, "Students": 0, "Residential": 0, "Transport": 0}
-    
-    try:
-        demand_gdf = ox.features_from_point(center_point, tags=query_tags, dist=req.radius)
-        if not demand_gdf.empty:
-            # Loop เพื่อจัดกลุ่ม (Segmentation)
-            for _, row in demand_gdf.iterrows():
-                assigned = False
-                # เช็คว่าแถวนี้ตรงกับ tag ไหนใน map
-                for col in demand_gdf.columns:
-                    val = str(row.get(col))
-                    if val in demand_tags_map:
-                        group = demand_tags_map[val]
-                        demand_breakdown[group] += 1
-                        assigned = True
-                        break
-                if not assigned: # ถ้าหาไม่เจอ ให้โยนลง Residential (ค่า Default)
-                    demand_breakdown["Residential"] += 1
-            
-            # เตรียมพิกัด
-            demand_gdf['centroid'] = demand_gdf.geometry.centroid
-            if len(demand_gdf) > 1000: demand_gdf = demand_gdf.sample(1000)
-            demand_points = [{"lat": p.y, "lon": p.x} for p in demand_gdf['centroid']]
-            
-    except Exception as e:
-        print(f"Error demand: {e}")
+    if isinstance(demand_result, Exception):
+        print(f"Error demand: {demand_result}")
+    else:
+        demand_breakdown, demand_points = demand_result
 
     # C. Future Growth (Construction Sites)
     growth_status = "ทรงตัว 🏙️"
     cons_count = 0
-    try:
-        cons_gdf = ox.features_from_point(center_point, tags={'landuse': 'construction'}, dist=req.radius)
-        cons_count = len(cons_gdf)
+    if not isinstance(cons_result, Exception):
+        cons_count = cons_result
         if cons_count > 5: growth_status = "กำลังบูมสุดๆ 🚀"
         elif cons_count > 2: growth_status = "กำลังเติบโต 📈"
-    except:
-        pass
 
     # D. Calculate Score & Prepare Result
     num_demand = len(demand_points)
@@ -445,7 +522,7 @@ async def analyze_market(request: Request, req: AnalyzeRequest):
     }
     
     # Save to cache before returning
-    cache.set(result, **cache_key_params)
+    await cache.aset(result, **cache_key_params)
     
     return result
 
@@ -484,18 +561,24 @@ async def ask_ai_stream(request: Request, data: AIRequest):
     
     async def generate():
         try:
+            # SDK streams are blocking iterators; pull each chunk in a worker thread
             if USING_NEW_GENAI:
-                response = client.models.generate_content(
+                stream = await asyncio.to_thread(
+                    client.models.generate_content_stream,
                     model='gemini-2.0-flash-exp',
                     contents=prompt,
                     config={'response_modalities': ['TEXT']}
                 )
-                yield response.text
             else:
-                response = model.generate_content(prompt, stream=True)
-                for chunk in response:
-                    if chunk.text:
-                        yield chunk.text
+                stream = await asyncio.to_thread(model.generate_content, prompt, stream=True)
+            
+            chunks = iter(stream)
+            while True:
+                chunk = await asyncio.to_thread(next, chunks, None)
+                if chunk is None:
+                    break
+                if chunk.text:
+                    yield chunk.text
         except Exception as e:
             print(f"AI Streaming Error: {e}")
             yield f"Error: {str(e)}"